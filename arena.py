@@ -0,0 +1,211 @@
+"""
+An array-backed DOM for bulk processing.
+
+ArenaHTMLParser builds the same tree as HTMLParser, but every node lives
+in a set of parallel arrays on an ArenaDocument and is addressed by an
+integer id. ArenaElement and ArenaText are thin views over those arrays
+that subclass Element and Text, so style(), tree_to_list() and layout
+work on them unchanged. Views are created on demand and have no
+__dict__, just (document, id) plus the unused slots they inherit, so a
+parsed page costs a handful of ints per node instead of a Python object
+graph.
+
+The price is paid on access instead: every read of .children or .parent
+makes new view objects, so code that walks an arena tree repeatedly
+should hold on to the lists it gets rather than re-reading them.
+"""
+
+from array import array
+from types import MappingProxyType
+
+from browser import Element, Text, HTMLParser
+
+NO_NODE = -1
+TEXT_TAG = -1
+NO_ATTRIBUTES = MappingProxyType({})
+
+class ArenaDocument:
+    def __init__(self):
+        self.tag_names = []
+        self.tag_ids = {}
+
+        self.tags = array("i")
+        self.parents = array("i")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        self.text_start = array("q")
+        self.text_end = array("q")
+
+        # Sparse per-node data: None until a node actually has some.
+        self.attributes = []
+        self.styles = []
+
+        self.chunks = []
+        self.text_length = 0
+        self._buffer = ""
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getstate__(self):
+        self.buffer  # pickle one joined string rather than every chunk
+        return self.__dict__
+
+    def tag_id(self, tag):
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.tag_names)
+            self.tag_names.append(tag)
+        return self.tag_ids[tag]
+
+    def new_node(self, tag_id, parent_id):
+        node_id = len(self.tags)
+        self.tags.append(tag_id)
+        self.parents.append(parent_id)
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.text_start.append(self.text_length)
+        self.text_end.append(self.text_length)
+        self.attributes.append(None)
+        self.styles.append(None)
+        return node_id
+
+    def new_element(self, tag, attributes, parent_id):
+        node_id = self.new_node(self.tag_id(tag), parent_id)
+        if attributes:
+            self.attributes[node_id] = attributes
+        return node_id
+
+    def new_text(self, text, parent_id):
+        node_id = self.new_node(TEXT_TAG, parent_id)
+        self.chunks.append(text)
+        self.text_length += len(text)
+        self.text_end[node_id] = self.text_length
+        return node_id
+
+    def append_child(self, parent_id, node_id):
+        last = self.last_child[parent_id]
+        if last == NO_NODE:
+            self.first_child[parent_id] = node_id
+        else:
+            self.next_sibling[last] = node_id
+        self.last_child[parent_id] = node_id
+
+    @property
+    def buffer(self):
+        # Text is appended as chunks while parsing and joined into one
+        # string the first time anybody reads it.
+        if len(self._buffer) != self.text_length:
+            self._buffer = "".join(self.chunks)
+            self.chunks = [self._buffer]
+        return self._buffer
+
+    def text(self, node_id):
+        return self.buffer[self.text_start[node_id]:self.text_end[node_id]]
+
+    def child_ids(self, node_id):
+        child = self.first_child[node_id]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def view(self, node_id):
+        if node_id == NO_NODE:
+            return None
+        if self.tags[node_id] == TEXT_TAG:
+            return ArenaText(self, node_id)
+        return ArenaElement(self, node_id)
+
+    @property
+    def root(self):
+        return self.view(0) if len(self) else None
+
+class ArenaNode:
+    # Shared view behaviour; mixed into the Element/Text subclasses below
+    # so isinstance() checks throughout browser.py keep working.
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return isinstance(other, ArenaNode) and \
+            self.document is other.document and self.id == other.id
+
+    def __hash__(self):
+        return hash((id(self.document), self.id))
+
+    @property
+    def parent(self):
+        return self.document.view(self.document.parents[self.id])
+
+    @property
+    def children(self):
+        # A fresh list of fresh views on every access; see the docstring
+        document = self.document
+        return [document.view(child) for child in document.child_ids(self.id)]
+
+    @property
+    def style(self):
+        return self.document.styles[self.id]
+
+    @style.setter
+    def style(self, value):
+        self.document.styles[self.id] = value
+
+class ArenaElement(ArenaNode, Element):
+    __slots__ = ("document", "id")
+
+    def __init__(self, document, node_id):
+        self.document = document
+        self.id = node_id
+
+    @property
+    def tag(self):
+        return self.document.tag_names[self.document.tags[self.id]]
+
+    @property
+    def attributes(self):
+        # Reading (style() does, for every element) mustn't allocate a
+        # dict per element, so attribute-less nodes all share one
+        # read-only empty mapping; write through set_attribute().
+        attributes = self.document.attributes[self.id]
+        return NO_ATTRIBUTES if attributes is None else attributes
+
+    def set_attribute(self, name, value):
+        attributes = self.document.attributes[self.id]
+        if attributes is None:
+            attributes = self.document.attributes[self.id] = {}
+        attributes[name] = value
+
+class ArenaText(ArenaNode, Text):
+    __slots__ = ("document", "id")
+
+    def __init__(self, document, node_id):
+        self.document = document
+        self.id = node_id
+
+    @property
+    def text(self):
+        return self.document.text(self.id)
+
+class ArenaHTMLParser(HTMLParser):
+    def __init__(self, body):
+        super().__init__(body)
+        self.document = ArenaDocument()
+        # No DocumentIndex: it would read every element's attributes,
+        # giving each one a dict, and keep a view per element alive.
+        self.index = None
+
+    def register(self, node):
+        pass
+
+    def new_element(self, tag, attributes, parent):
+        parent_id = parent.id if parent is not None else NO_NODE
+        return ArenaElement(self.document,
+            self.document.new_element(tag, attributes, parent_id))
+
+    def new_text(self, text, parent):
+        return ArenaText(self.document,
+            self.document.new_text(text, parent.id))
+
+    def append_child(self, parent, node):
+        self.document.append_child(parent.id, node.id)
@@ -0,0 +1,134 @@
+"""
+Headless batch parsing for large crawls.
+
+parse_many() fans bodies out over a ProcessPoolExecutor. Each worker
+parses into an ArenaDocument (see arena.py) and, by default, applies the
+default style sheet. Arena documents are a few flat arrays plus one text
+buffer, so they pickle back to the parent quickly and compactly.
+
+style_parallel() goes the other way for one large document: it styles
+the top-level subtrees in separate processes and merges the computed
+styles back into the tree.
+"""
+
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from browser import URL, DEFAULT_RULES, Element, RuleIndex, iter_tree, style, \
+    style_node
+from arena import ArenaHTMLParser
+from serialize import dumps, loads
+
+def parse_document(body, with_style=True):
+    parser = ArenaHTMLParser(body)
+    root = parser.parse()
+    if with_style:
+        style(root, DEFAULT_RULES)
+    return parser.document
+
+def fetch_and_parse(url, with_style=True):
+    return parse_document(URL(url).request(), with_style)
+
+def run_chunk(function, items, args):
+    return [function(item, *args) for item in items]
+
+def map_bounded(executor, function, items, args, chunksize, workers):
+    # Like executor.map(), which submits every item up front, but with
+    # at most two chunks per worker in flight: items are only pulled
+    # from the iterable as results are consumed, so a lazily generated
+    # crawl isn't read into memory all at once.
+    items = iter(items)
+    window = 2 * (workers or os.cpu_count() or 1)
+    pending = collections.deque()
+    for chunk in iter(lambda: list(itertools.islice(items, chunksize)), []):
+        pending.append(executor.submit(run_chunk, function, chunk, args))
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+def parse_many(bodies, workers=None, with_style=True, chunksize=4):
+    # Yields one ArenaDocument per body, in order, as results come back.
+    # bodies can be any iterable; see map_bounded().
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from map_bounded(executor, parse_document, bodies,
+            (with_style,), chunksize, workers)
+
+def fetch_and_parse_many(urls, workers=None, with_style=True, chunksize=1):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from map_bounded(executor, fetch_and_parse, urls,
+            (with_style,), chunksize, workers)
+
+def split_points(tree):
+    # Follows single-child chains (html -> body) down to the first node
+    # with several children; its children are the subtrees to farm out.
+    chain = [tree]
+    while len(chain[-1].children) == 1:
+        chain.append(chain[-1].children[0])
+    return chain, chain[-1].children
+
+WORKER_RULES = None
+
+def set_worker_rules(rules):
+    # Pool initializer, so the rules are pickled once per worker rather
+    # than once per task.
+    global WORKER_RULES
+    WORKER_RULES = rules
+
+def style_subtrees(context, payloads):
+    # context is the split point's ancestor chain, top down, as
+    # (tag, attributes, style); descendant selectors and inheritance
+    # only ever look upwards, so that's all a subtree needs.
+    parent = None
+    for tag, attributes, computed in context:
+        parent = Element(tag, attributes, parent)
+        parent.style = computed
+    results = []
+    for data in payloads:
+        root = loads(data)
+        root.parent = parent
+        style(root, WORKER_RULES)
+        results.append([node.style for node in iter_tree(root)])
+    return results
+
+def style_parallel(tree, rules=DEFAULT_RULES, workers=None, min_nodes=20000,
+                   chunks_per_worker=4):
+    # Same result as style(tree, rules). Style sharing only happens
+    # within a chunk, so this only pays off on large documents with
+    # many workers; smaller trees are just styled here.
+    if isinstance(rules, list):
+        rules = RuleIndex(rules)
+    workers = workers or os.cpu_count() or 1
+    chain, subtrees = split_points(tree)
+    sizes = [sum(1 for _ in iter_tree(subtree)) for subtree in subtrees]
+    if workers == 1 or len(subtrees) < 2 or sum(sizes) < min_nodes:
+        style(tree, rules)
+        return
+
+    for node in chain:
+        style_node(node, rules)
+    context = [(node.tag, dict(node.attributes), node.style)
+               for node in chain]
+
+    # Consecutive subtrees, grouped into chunks of similar node counts
+    target = sum(sizes) / (workers * chunks_per_worker)
+    chunks = [[]]
+    total = 0
+    for subtree, size in zip(subtrees, sizes):
+        if total >= target:
+            chunks.append([])
+            total = 0
+        chunks[-1].append(subtree)
+        total += size
+
+    with ProcessPoolExecutor(max_workers=workers,
+            initializer=set_worker_rules, initargs=(rules,)) as executor:
+        futures = [executor.submit(style_subtrees, context,
+                                   [dumps(subtree) for subtree in chunk])
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for subtree, styles in zip(chunk, future.result()):
+                for node, computed in zip(iter_tree(subtree), styles):
+                    node.style = computed
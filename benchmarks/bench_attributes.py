@@ -0,0 +1,64 @@
+"""
+Times HTMLTokenizer.get_attributes on attribute-heavy tags, next to the
+old whitespace-splitting version it replaced.
+
+Run from the repository root: python benchmarks/bench_attributes.py
+"""
+
+import timeit
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import HTMLParser, HTMLTokenizer
+
+def split_get_attributes(text):
+    parts = text.split()
+    tag = parts[0].casefold()
+    attributes = {}
+    for attrpair in parts[1:]:
+        if "=" in attrpair:
+            key, value = attrpair.split("=", 1)
+            if len(value) > 2 and value[0] in ["'", "\""]:
+                value = value[1:-1]
+            attributes[key.casefold()] = value
+        else:
+            attributes[attrpair.casefold()] = ""
+    return tag, attributes
+
+TAGS = {
+    "bare": "a href=/index.html id=home class=nav rel=nofollow target=_blank",
+    "quoted": 'input type="text" name="q" value="search" class="form-control" '
+              'placeholder="Search" autocomplete="off" aria-label="Search"',
+    "many": " ".join(["div"] + ['data-x{}="{}"'.format(i, i) for i in range(40)]),
+    "spaces": 'img alt="a picture of a cat sitting on a mat" '
+              'title="another long title with spaces" src="cat.png"',
+}
+
+def bench(name, text, number=4000, repeat=10):
+    # Best of several short runs, interleaved, so that noise on a busy
+    # machine doesn't favour whichever version happens to run first
+    tokenizer = HTMLTokenizer("")
+    new = old = float("inf")
+    for _ in range(repeat):
+        new = min(new, timeit.timeit(
+            lambda: tokenizer.get_attributes(text), number=number))
+        old = min(old, timeit.timeit(
+            lambda: split_get_attributes(text), number=number))
+    print("{:8} {:8.2f} us/tag  (split: {:.2f} us/tag)".format(
+        name, new / number * 1e6, old / number * 1e6))
+
+def bench_page(repeat=2000):
+    page = "<body>" + "".join(
+        "<" + text + ">x</" + text.split()[0] + ">"
+        for text in TAGS.values()) * repeat + "</body>"
+    seconds = min(timeit.repeat(lambda: HTMLParser(page).parse(),
+                                number=1, repeat=3))
+    print("page     {:8.2f} MB/s over {} KB".format(
+        len(page) / seconds / 1e6, len(page) // 1000))
+
+if __name__ == "__main__":
+    for name, text in TAGS.items():
+        bench(name, text)
+    bench_page()
@@ -0,0 +1,45 @@
+"""
+Measures parse_many() throughput with 1..N worker processes.
+
+Run from the repository root: python benchmarks/bench_batch.py [N]
+"""
+
+import os
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import parse_document, parse_many
+
+def make_page(i):
+    rows = "".join(
+        "<tr><td class=c{0}>cell {0}</td><td><a href=/p/{0}>link</a></td></tr>"
+        .format(j) for j in range(50))
+    paragraphs = "".join(
+        "<p>Paragraph {} of page {} with <b>bold</b> and <i>italic</i> text.</p>"
+        .format(j, i) for j in range(100))
+    return "<html><head><title>Page {}</title></head><body>" \
+        "<table>{}</table>{}</body></html>".format(i, rows, paragraphs)
+
+def bench(bodies, workers):
+    start = time.perf_counter()
+    if workers == 0:
+        nodes = sum(len(parse_document(body)) for body in bodies)
+    else:
+        nodes = sum(len(doc) for doc in parse_many(bodies, workers))
+    return time.perf_counter() - start, nodes
+
+if __name__ == "__main__":
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    bodies = [make_page(i) for i in range(200)]
+    megabytes = sum(len(body) for body in bodies) / 1e6
+
+    serial, _ = bench(bodies, 0)
+    print("serial     {:7.1f} docs/s {:6.2f} MB/s".format(
+        len(bodies) / serial, megabytes / serial))
+    for workers in range(1, max_workers + 1):
+        seconds, nodes = bench(bodies, workers)
+        print("{:2} workers {:7.1f} docs/s {:6.2f} MB/s {:5.2f}x serial".format(
+            workers, len(bodies) / seconds, megabytes / seconds,
+            serial / seconds))
@@ -0,0 +1,92 @@
+"""
+Times CSSParser on a large synthetic stylesheet shaped like a CSS
+framework (comments, class selectors, multi-token values, @media blocks,
+pseudo-classes), next to the old character-at-a-time scanner.
+
+Run from the repository root: python benchmarks/bench_css.py
+"""
+
+import random
+import timeit
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import CSSParser
+
+class CharCSSParser(CSSParser):
+    # The scanner CSSParser used before it was regex-driven. Values are
+    # single words, as they were then.
+    def whitespace(self):
+        while self.i < len(self.s) and self.s[self.i].isspace():
+            self.i += 1
+
+    def word(self):
+        start = self.i
+        while self.i < len(self.s):
+            if self.s[self.i].isalnum() or self.s[self.i] in "#-.%":
+                self.i += 1
+            else:
+                break
+        if not (self.i > start):
+            raise Exception("Parsing error")
+        return self.s[start:self.i]
+
+    def value(self):
+        return self.word()
+
+    def ignore_until(self, chars):
+        while self.i < len(self.s):
+            if self.s[self.i] in chars:
+                return self.s[self.i]
+            else:
+                self.i += 1
+        return None
+
+    def skip_rule(self):
+        if self.ignore_until(["}"]) == "}":
+            self.i += 1
+
+DECLARATIONS = [
+    "color: #212529",
+    "background-color: transparent",
+    "border: 1px solid rgba(0, 0, 0, 0.125)",
+    "font-size: 0.875rem",
+    "font-weight: 400",
+    "margin: 0 auto",
+    "padding: 0.375rem 0.75rem",
+    "font-family: -apple-system, \"Segoe UI\", Roboto, sans-serif",
+    "transition: color 0.15s ease-in-out, background-color 0.15s ease-in-out",
+    "display: block !important",
+]
+
+def make_stylesheet(rules=20000, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for i in range(rules):
+        if i % 50 == 0:
+            out.append("/* Section {} ---------------------------------- */".format(i))
+        selector = rng.choice([
+            ".c{}", ".c{} .d{}", "div .c{}", ".c{}:hover", "p", "h{}",
+        ]).format(i % 6 + 1, i)
+        body = "; ".join(rng.sample(DECLARATIONS, rng.randint(1, 6)))
+        rule = "{} {{ {}; }}".format(selector, body)
+        if i % 100 == 99:
+            rule = "@media (min-width: 768px) {{ {} }}".format(rule)
+        out.append(rule)
+    return "\n".join(out)
+
+def bench(name, parser, source):
+    seconds = min(timeit.repeat(lambda: parser(source).parse(),
+                                number=1, repeat=3))
+    rules = parser(source).parse()
+    declarations = sum(len(body) for selector, body in rules)
+    print("{:6} {:7.2f} MB/s  {:6} rules  {:6} declarations".format(
+        name, len(source) / seconds / 1e6, len(rules), declarations))
+
+if __name__ == "__main__":
+    source = make_stylesheet()
+    print("{} KB stylesheet".format(len(source) // 1000))
+    bench("regex", CSSParser, source)
+    bench("char", CharCSSParser, source)
@@ -0,0 +1,52 @@
+"""
+Measures style_parallel() on one large document with 1..N worker
+processes, against plain style(), and checks they compute the same
+styles.
+
+Run from the repository root:
+
+    python benchmarks/bench_parallel_style.py [N] [nodes] [rules]
+"""
+
+import os
+import random
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import HTMLParser, RuleIndex, iter_tree, style
+from batch import style_parallel
+from bench_style import make_document, make_rules
+
+def bench(tree, rules, workers):
+    for node in iter_tree(tree):
+        node.style = None
+    start = time.perf_counter()
+    if workers == 0:
+        style(tree, rules)
+    else:
+        style_parallel(tree, rules, workers, min_nodes=0)
+    seconds = time.perf_counter() - start
+    return seconds, [node.style for node in iter_tree(tree)]
+
+if __name__ == "__main__":
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    rng = random.Random(0)
+    tree = HTMLParser(make_document(nodes, rng)).parse()
+    rules = RuleIndex(make_rules(count, rng))
+    print("{} nodes x {} rules on {} CPUs".format(
+        sum(1 for _ in iter_tree(tree)), count, os.cpu_count()))
+
+    serial, expected = bench(tree, rules, 0)
+    print("style()        {:8.3f} s".format(serial))
+    workers = 2
+    while True:
+        seconds, styles = bench(tree, rules, workers)
+        assert styles == expected, "parallel style gave different styles"
+        print("{:2} workers     {:8.3f} s  {:.2f}x serial".format(
+            workers, seconds, serial / seconds))
+        if workers >= max_workers: break
+        workers = min(workers * 2, max_workers)
@@ -0,0 +1,37 @@
+"""
+Compares serialize.dumps/loads with pickle on a styled document.
+
+Run from the repository root: python benchmarks/bench_serialize.py
+"""
+
+import pickle
+import timeit
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import HTMLParser, DEFAULT_STYLE_SHEET, cascade_priority, style
+import serialize
+
+def make_document(paragraphs=3000):
+    body = "".join(
+        "<p class=p{0}>Paragraph {0} with <b>bold</b>, <i>italic</i> and "
+        "<a href=/link/{0}>a link</a>.</p>".format(i)
+        for i in range(paragraphs))
+    tree = HTMLParser("<html><body>" + body + "</body></html>").parse()
+    style(tree, sorted(DEFAULT_STYLE_SHEET, key=cascade_priority))
+    return tree
+
+def bench(name, dumps, loads, tree, number=3):
+    data = dumps(tree)
+    write = min(timeit.repeat(lambda: dumps(tree), number=1, repeat=number))
+    read = min(timeit.repeat(lambda: loads(data), number=1, repeat=number))
+    print("{:10} {:8} KB  dumps {:6.1f} ms  loads {:6.1f} ms".format(
+        name, len(data) // 1000, write * 1000, read * 1000))
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(100000)
+    tree = make_document()
+    bench("serialize", serialize.dumps, serialize.loads, tree)
+    bench("pickle", pickle.dumps, pickle.loads, tree)
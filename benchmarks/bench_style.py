@@ -0,0 +1,129 @@
+"""
+Times style() on a large synthetic document with a large style sheet,
+then with its optimizations taken away one at a time: style sharing,
+the ancestor filter, and the rule index, down to the old loop that
+tested every rule on every node.
+
+Run from the repository root: python benchmarks/bench_style.py [nodes] [rules]
+"""
+
+import random
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import HTMLParser, CSSParser, RuleIndex, DEFAULT_STYLE_SHEET, \
+    AncestorFilter, cascade_priority, iter_tree, style, style_node
+
+TAGS = ["div", "p", "span", "a", "b", "i", "ul", "li", "table", "tr", "td",
+        "section", "article", "header", "footer", "nav", "h1", "h2", "em",
+        "strong", "small", "code", "pre", "blockquote"]
+UNUSED = ["tag{}".format(i) for i in range(200)]
+PROPERTIES = ["color", "background-color", "font-weight", "font-style"]
+
+def make_document(nodes, rng):
+    html = []
+    count = 0
+    depth = 0
+    while count < nodes:
+        if depth > 2 and rng.random() < 0.35:
+            html.append("</div>")
+            depth -= 1
+        elif rng.random() < 0.3:
+            html.append("<div>")
+            depth += 1
+            count += 1
+        else:
+            tag = rng.choice(TAGS)
+            html.append("<{0}>text <b>bold</b></{0}>".format(tag))
+            count += 3
+    return "<html><body>" + "".join(html) + "</body></html>"
+
+def make_rules(count, rng):
+    css = []
+    for _ in range(count):
+        tags = TAGS if rng.random() < 0.5 else UNUSED
+        selector = " ".join(rng.choice(tags) for _ in range(rng.randint(1, 3)))
+        css.append("{} {{ {}: {}; }}".format(
+            selector, rng.choice(PROPERTIES), rng.choice(["red", "blue", "bold"])))
+    return sorted(CSSParser("\n".join(css)).parse(), key=cascade_priority)
+
+class AllRules:
+    # The pre-index behaviour: every rule is a candidate for every node.
+    def __init__(self, rules):
+        self.entries = [(i, s, b) for i, (s, b) in enumerate(rules)]
+
+    def candidates(self, node):
+        return self.entries
+
+def style_filtered(tree, rules):
+    # style() without style sharing: every node goes through style_node,
+    # with the ancestor filter kept up to date the same way.
+    ancestors = AncestorFilter() if rules.combinators else None
+    stack = [(tree, False)]
+    while stack:
+        node, leaving = stack.pop()
+        if leaving:
+            ancestors.pop(node)
+            continue
+        style_node(node, rules, ancestors)
+        if node.children:
+            if ancestors is not None:
+                ancestors.push(node)
+                stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+
+def style_unfiltered(tree, rules):
+    for node in iter_tree(tree):
+        style_node(node, rules)
+
+def timed(tree, rules, styler=style):
+    start = time.perf_counter()
+    styler(tree, rules)
+    seconds = time.perf_counter() - start
+    return seconds, [dict(node.style) for node in iter_tree(tree)]
+
+def bench_sharing():
+    # Pages from the parser corpus; list- and table-heavy pages are where
+    # sibling style sharing pays off.
+    corpus = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+    rules = RuleIndex(sorted(DEFAULT_STYLE_SHEET, key=cascade_priority))
+    for page in ["tables/big-table", "attributes/form-controls",
+                 "real-world/comment-thread"]:
+        with open(os.path.join(corpus, page + ".html"), encoding="utf8") as f:
+            tree = HTMLParser(f.read()).parse()
+        nodes = sum(1 for _ in iter_tree(tree))
+        shared, _ = timed(tree, rules)
+        distinct = len({id(node.style) for node in iter_tree(tree)})
+        unshared, _ = timed(tree, rules, style_filtered)
+        print("{:26} {:6} nodes {:5} styles  {:6.1f} ms (unshared {:6.1f} ms)".format(
+            page, nodes, distinct, shared * 1000, unshared * 1000))
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(0)
+    tree = HTMLParser(make_document(nodes, rng)).parse()
+    rules = make_rules(count, rng)
+    total = sum(1 for _ in iter_tree(tree))
+    print("{} nodes x {} rules".format(total, len(rules)))
+
+    # style() both filters and shares styles, so each is timed on its own
+    # too; every row's ratio is against style().
+    shared, shared_styles = timed(tree, RuleIndex(rules))
+    print("indexed + filter + sharing {:8.3f} s".format(shared))
+    rows = [
+        ("indexed + filter", RuleIndex(rules), style_filtered),
+        ("indexed", RuleIndex(rules), style_unfiltered),
+        ("all rules", AllRules(rules), style_unfiltered),
+    ]
+    for name, index, styler in rows:
+        seconds, styles = timed(tree, index, styler)
+        print("{:26} {:8.3f} s  ({:.1f}x slower)".format(
+            name, seconds, seconds / shared))
+        assert styles == shared_styles, \
+            "optimized cascade gave different styles"
+    print()
+    bench_sharing()
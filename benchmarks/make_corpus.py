@@ -0,0 +1,152 @@
+"""
+Regenerates the HTML pages in benchmarks/corpus/. The pages are
+deterministic, so rerunning this only changes them if this script
+changes. After regenerating, refresh the expected trees with
+python benchmarks/run_corpus.py update
+
+Run from the repository root: python benchmarks/make_corpus.py
+"""
+
+import os
+import random
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+WORDS = ("the quick brown fox jumps over lazy dog browser engine layout "
+         "style cascade parser token node tree paint render frame").split()
+
+def sentence(rng, n=12):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+def page(title, body, head=""):
+    return ("<!doctype html>\n<html>\n<head>\n<title>{}</title>\n{}</head>\n"
+            "<body>\n{}\n</body>\n</html>\n").format(title, head, body)
+
+def deep_divs(rng):
+    depth = 2000
+    return page("Deep divs", "<div>" * depth + sentence(rng) + "</div>" * depth)
+
+def deep_unclosed(rng):
+    # Unclosed <li> and <p> pile up on the open-element stack
+    items = "".join("<ul><li>" + sentence(rng, 4) for _ in range(800))
+    return page("Deep unclosed lists", items)
+
+def big_table(rng):
+    rows = []
+    for i in range(600):
+        cells = "".join("<td>{}</td>".format(rng.randint(0, 10**6))
+                        for _ in range(8))
+        rows.append("<tr class=row{}>{}</tr>".format(i % 2, cells))
+    return page("Big table",
+        "<table>\n<thead><tr>" + "<th>col</th>" * 8 + "</tr></thead>\n"
+        "<tbody>\n" + "\n".join(rows) + "\n</tbody>\n</table>")
+
+def implicit_table(rng):
+    rows = "".join("<tr><td>{}<td>{}<td>{}".format(
+        rng.choice(WORDS), rng.choice(WORDS), rng.randint(0, 999))
+        for _ in range(600))
+    return page("Table without end tags", "<table>" + rows + "</table>")
+
+def attributes(rng):
+    out = []
+    for i in range(600):
+        out.append(
+            '<a href="/item/{0}?ref=list&amp;page={1}" class="link item-{0} '
+            'primary" id=item{0} data-index={0} data-label=\'{2} {3}\' '
+            'title="{4}" target=_blank rel="nofollow noopener" '
+            'aria-label="Open item {0}" tabindex=0 hidden>{2}</a>'.format(
+                i, i // 20, rng.choice(WORDS), rng.choice(WORDS),
+                sentence(rng, 5)))
+    return page("Attribute-heavy", "\n".join(out))
+
+def form_controls(rng):
+    fields = "".join(
+        '<p><label for=f{0}>Field {0}</label> <input type=text name=field{0} '
+        'id=f{0} value="{1}" placeholder="{2}" required></p>\n'.format(
+            i, rng.choice(WORDS), sentence(rng, 3))
+        for i in range(600))
+    return page("Form controls",
+        "<form action=/submit method=post>\n" + fields +
+        "<button type=submit>Send</button>\n</form>")
+
+def scripts(rng):
+    blocks = []
+    for i in range(300):
+        blocks.append(
+            "<script>\nfor (var i = 0; i < {0}; i++) {{ if (i > 2 && x < y) "
+            "{{ total += i; }} }}\ndocument.write('<b>' + {0} + '</b>');\n"
+            "</script>\n<p>{1}</p>".format(i, sentence(rng)))
+    head = "<style>p > b {{ color: red }} a:hover {{ color: blue }}</style>\n"
+    return page("Script-heavy", "\n".join(blocks), head)
+
+def comments(rng):
+    parts = []
+    for i in range(800):
+        parts.append("<!-- comment {} with <tags> and > signs -->"
+                     "<p>{}</p>".format(i, sentence(rng)))
+    return page("Comment-heavy", "\n".join(parts))
+
+def entities(rng):
+    names = ["&amp;", "&lt;", "&gt;", "&quot;", "&#169;", "&#x2014;",
+             "&nbsp;", "&hellip;", "&eacute;", "&copy;"]
+    paragraphs = []
+    for _ in range(600):
+        words = []
+        for _ in range(15):
+            words.append(rng.choice(WORDS))
+            if rng.random() < 0.4:
+                words.append(rng.choice(names))
+        paragraphs.append("<p>" + " ".join(words) + "</p>")
+    return page("Entity-heavy", "\n".join(paragraphs))
+
+def article(rng):
+    head = ('<meta charset=utf-8>\n<meta name=viewport content="width=device-width">\n'
+            '<link rel=stylesheet href=/site.css>\n<link rel=icon href=/favicon.ico>\n')
+    nav = "<nav><ul>" + "".join(
+        "<li><a href=/section/{0}>{1}</a></li>".format(i, rng.choice(WORDS))
+        for i in range(12)) + "</ul></nav>"
+    sections = []
+    for i in range(40):
+        paragraphs = "".join(
+            "<p>{} <a href=/ref/{}>{}</a> {} <b>{}</b> <i>{}</i></p>\n".format(
+                sentence(rng, 20), rng.randint(0, 999), rng.choice(WORDS),
+                sentence(rng, 15), rng.choice(WORDS), rng.choice(WORDS))
+            for _ in range(6))
+        sections.append("<section><h2>{}</h2>\n{}</section>".format(
+            sentence(rng, 4), paragraphs))
+    body = ("<header><h1>{}</h1>{}</header>\n<main><article>\n{}\n"
+            "</article></main>\n<footer><p>&copy; 2026</p></footer>").format(
+            sentence(rng, 6), nav, "\n".join(sections))
+    return page("Article", body, head)
+
+def comment_thread(rng):
+    posts = []
+    for i in range(300):
+        posts.append(
+            '<div class=post id=post{0}><div class=meta><b>user{1}</b> '
+            '<small>{2} minutes ago</small></div><blockquote>{3}</blockquote>'
+            '<p>{4}<br>{5}</p><a href="/reply?to={0}">reply</a></div>'.format(
+                i, rng.randint(1, 50), rng.randint(1, 59), sentence(rng, 8),
+                sentence(rng), sentence(rng)))
+    form = ("<form action=/post method=post><input name=author>"
+            "<input name=text><button>Post</button></form>")
+    return page("Comment thread", "\n".join(posts) + form)
+
+PAGES = {
+    "deep-nesting": [deep_divs, deep_unclosed],
+    "tables": [big_table, implicit_table],
+    "attributes": [attributes, form_controls],
+    "scripts": [scripts, comments],
+    "entities": [entities],
+    "real-world": [article, comment_thread],
+}
+
+if __name__ == "__main__":
+    for page_class, generators in PAGES.items():
+        os.makedirs(os.path.join(CORPUS, page_class), exist_ok=True)
+        for generate in generators:
+            name = generate.__name__.replace("_", "-") + ".html"
+            path = os.path.join(CORPUS, page_class, name)
+            with open(path, "w", encoding="utf8", newline="\n") as f:
+                f.write(generate(random.Random(name)))
+            print("wrote", os.path.relpath(path))
@@ -0,0 +1,42 @@
+"""
+Styles a page with the cascade profiler on and prints the selectors that
+took the most time, to find pathological rules.
+
+Run from the repository root:
+
+    python benchmarks/profile_style.py page.html [sheet.css ...]
+
+The default style sheet always applies; any sheets given are added after
+it, as <link>ed sheets would be.
+"""
+
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import HTMLParser, CSSParser, CASCADE_CACHE, DEFAULT_STYLE_SHEET, \
+    StyleProfile, style
+
+def read(path):
+    with open(path, encoding="utf8") as f:
+        return f.read()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(1)
+    tree = HTMLParser(read(sys.argv[1])).parse()
+    sheets = [DEFAULT_STYLE_SHEET] + \
+        [CSSParser(read(path)).parse() for path in sys.argv[2:]]
+    rules = CASCADE_CACHE.rules(sheets)
+
+    start = time.perf_counter()
+    style(tree, rules)
+    print("style() {:.1f} ms unprofiled".format(
+        (time.perf_counter() - start) * 1000))
+
+    profile = StyleProfile()
+    style(tree, rules, profile)
+    profile.report()
@@ -0,0 +1,108 @@
+"""
+Checks HTMLParser against the pages in benchmarks/corpus/ and measures
+how fast it parses them.
+
+    python benchmarks/run_corpus.py check   compare trees with the .txt dumps
+    python benchmarks/run_corpus.py update  rewrite the .txt dumps
+    python benchmarks/run_corpus.py bench   report MB/s and nodes/s per class
+
+Run from the repository root.
+"""
+
+import os
+import time
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import HTMLParser
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def corpus_pages():
+    for page_class in sorted(os.listdir(CORPUS)):
+        directory = os.path.join(CORPUS, page_class)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".html"):
+                yield page_class, os.path.join(directory, name)
+
+def read(path):
+    with open(path, encoding="utf8", newline="") as f:
+        return f.read()
+
+def dump_tree(tree):
+    # One node per line, prefixed by its depth rather than indented, so
+    # dumps of deeply nested pages stay small.
+    lines = []
+    stack = [(tree, 0)]
+    while stack:
+        node, depth = stack.pop()
+        lines.append("{} {!r}".format(depth, node))
+        stack.extend((child, depth + 1) for child in reversed(node.children))
+    return "\n".join(lines) + "\n"
+
+def expected_path(path):
+    return path[:-len(".html")] + ".txt"
+
+def check():
+    failures = 0
+    for page_class, path in corpus_pages():
+        actual = dump_tree(HTMLParser(read(path)).parse())
+        expected = read(expected_path(path))
+        if actual == expected:
+            print("ok  ", os.path.relpath(path, CORPUS))
+            continue
+        failures += 1
+        actual_lines, expected_lines = actual.splitlines(), expected.splitlines()
+        for i, (a, e) in enumerate(zip(actual_lines, expected_lines)):
+            if a != e: break
+        else:
+            i = min(len(actual_lines), len(expected_lines))
+        print("FAIL", os.path.relpath(path, CORPUS), "at line", i + 1)
+        print("  expected:", expected_lines[i] if i < len(expected_lines) else "<end>")
+        print("  actual:  ", actual_lines[i] if i < len(actual_lines) else "<end>")
+    return failures
+
+def update():
+    for page_class, path in corpus_pages():
+        with open(expected_path(path), "w", encoding="utf8", newline="\n") as f:
+            f.write(dump_tree(HTMLParser(read(path)).parse()))
+        print("wrote", os.path.relpath(expected_path(path), CORPUS))
+
+def count_nodes(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+def bench(repeat=3):
+    totals = {}
+    for page_class, path in corpus_pages():
+        body = read(path)
+        seconds = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            tree = HTMLParser(body).parse()
+            seconds = min(seconds, time.perf_counter() - start)
+        size, nodes, elapsed = totals.get(page_class, (0, 0, 0))
+        totals[page_class] = (size + len(body.encode("utf8")),
+                              nodes + count_nodes(tree), elapsed + seconds)
+    print("{:14} {:>9} {:>9} {:>12}".format("class", "KB", "MB/s", "nodes/s"))
+    for page_class, (size, nodes, seconds) in totals.items():
+        print("{:14} {:9} {:9.2f} {:12.0f}".format(
+            page_class, size // 1000, size / seconds / 1e6, nodes / seconds))
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "check":
+        sys.exit(1 if check() else 0)
+    elif command == "update":
+        update()
+    elif command == "bench":
+        bench()
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -1,7 +1,17 @@
+import functools
+import hashlib
+import heapq
+import math
+import os
+import re
 import socket
 import ssl
+import time
 import tkinter
 import tkinter.font
+import weakref
+import zlib
+from collections import OrderedDict
 
 WIDTH, HEIGHT = 800, 600
 HSTEP, VSTEP = 13, 18
@@ -142,6 +152,8 @@ def get_font(size, weight, style):
     return FONTS[key][0]
 
 class Text:
+    __slots__ = ("text", "children", "parent", "style")
+
     def __init__(self, text, parent):
         self.text = text
         self.children = []
@@ -151,6 +163,8 @@ class Text:
         return repr(self.text)
 
 class Element:
+    __slots__ = ("tag", "attributes", "children", "parent", "style")
+
     def __init__(self, tag, attributes, parent):
         self.tag = tag
         self.attributes = attributes
@@ -168,153 +182,516 @@ class TagSelector:
     def __init__(self, tag):
         self.tag = tag
         self.priority = 1
+        self.ancestor_keys = ()
     
     def __repr__(self):
         return f"TagSelector(tag={self.tag}, priority={self.priority})"
 
-    def matches(self, node):
+    def __str__(self):
+        return self.tag
+
+    def matches(self, node, stats=None):
         return isinstance(node, Element) and node.tag == self.tag
-    
+
+    def rightmost(self):
+        return self
+
+    def bloom_keys(self):
+        return [self.tag]
+
+    def attribute_names(self):
+        return []
+
+    def index_key(self):
+        return ("tag", self.tag)
+
+class CompoundSelector:
+    # Tag, #id, .class and [attribute] parts that all have to match the
+    # same element, like "p.intro" or "input[type=text]". A bare tag is
+    # still a TagSelector; see CSSParser.simple_selector().
+    def __init__(self, tag=None, ids=(), classes=(), attributes=()):
+        self.tag = tag
+        self.ids = tuple(ids)
+        self.classes = tuple(classes)
+        self.attributes = tuple(attributes)  # (name, value or None)
+        self.priority = 100 * len(self.ids) + \
+            10 * (len(self.classes) + len(self.attributes)) + \
+            (1 if tag is not None else 0)
+        self.ancestor_keys = ()
+
+    def __repr__(self):
+        return "CompoundSelector(tag={}, ids={}, classes={}, " \
+            "attributes={}, priority={})".format(self.tag, self.ids,
+            self.classes, self.attributes, self.priority)
+
+    def __str__(self):
+        out = self.tag or ("" if self.ids or self.classes else "*")
+        out += "".join("#" + id for id in self.ids)
+        out += "".join("." + name for name in self.classes)
+        for name, value in self.attributes:
+            out += "[{}]".format(name if value is None
+                                 else "{}={!r}".format(name, value))
+        return out
+
+    def matches(self, node, stats=None):
+        if not isinstance(node, Element): return False
+        if self.tag is not None and node.tag != self.tag: return False
+        attributes = node.attributes
+        for id in self.ids:
+            if attributes.get("id") != id: return False
+        if self.classes:
+            classes = attributes.get("class", "").split()
+            for name in self.classes:
+                if name not in classes: return False
+        for name, value in self.attributes:
+            if name not in attributes: return False
+            if value is not None and attributes[name] != value: return False
+        return True
+
+    def rightmost(self):
+        return self
+
+    def bloom_keys(self):
+        # Must agree with AncestorFilter.node_keys()
+        keys = [self.tag] if self.tag is not None else []
+        keys.extend("#" + id for id in self.ids)
+        keys.extend("." + name for name in self.classes)
+        return keys
+
+    def attribute_names(self):
+        names = [name for name, value in self.attributes]
+        if self.ids: names.append("id")
+        if self.classes: names.append("class")
+        return names
+
+    def index_key(self):
+        # The most selective part decides which RuleIndex bucket it's in
+        if self.ids: return ("id", self.ids[0])
+        if self.classes: return ("class", self.classes[0])
+        if self.tag is not None: return ("tag", self.tag)
+        return None
+
 class DescendantSelector:
     def __init__(self, ancestor, descendant):
         self.ancestor = ancestor
         self.descendant = descendant
         self.priority = ancestor.priority + descendant.priority
+        # Everything left of the rightmost selector has to be found
+        # among the node's ancestors; see AncestorFilter.
+        self.ancestor_keys = AncestorFilter.hashes(ancestor.bloom_keys())
+
+    def __str__(self):
+        return "{} {}".format(self.ancestor, self.descendant)
 
-    def matches(self, node):
-        if not self.descendant.matches(node): return False
+    def matches(self, node, stats=None):
+        # stats is a SelectorStats when profiling; see StyleProfile
+        if not self.descendant.matches(node, stats): return False
         while node.parent:
-            if self.ancestor.matches(node.parent): return True
+            if stats is not None: stats.steps += 1
+            if self.ancestor.matches(node.parent, stats): return True
             node = node.parent
         return False
 
+    def rightmost(self):
+        return self.descendant.rightmost()
+
+    def bloom_keys(self):
+        return self.ancestor.bloom_keys() + self.descendant.bloom_keys()
+
+    def attribute_names(self):
+        return self.ancestor.attribute_names() + \
+            self.descendant.attribute_names()
+
+class ChildSelector:
+    def __init__(self, parent, child):
+        self.parent = parent
+        self.child = child
+        self.priority = parent.priority + child.priority
+        self.ancestor_keys = AncestorFilter.hashes(parent.bloom_keys())
+
+    def __str__(self):
+        return "{} > {}".format(self.parent, self.child)
+
+    def matches(self, node, stats=None):
+        if not self.child.matches(node, stats): return False
+        if node.parent is None: return False
+        if stats is not None: stats.steps += 1
+        return self.parent.matches(node.parent, stats)
+
+    def rightmost(self):
+        return self.child.rightmost()
+
+    def bloom_keys(self):
+        return self.parent.bloom_keys() + self.child.bloom_keys()
+
+    def attribute_names(self):
+        return self.parent.attribute_names() + self.child.attribute_names()
+
+class AncestorFilter:
+    # A counting Bloom filter over the tags, ids and classes of the
+    # elements enclosing the node being styled. If anything a descendant
+    # or child selector needs is definitely absent, the selector can't
+    # match and we skip the walk up node.parent entirely.
+    BITS = 12
+    MASK = (1 << BITS) - 1
+
+    def __init__(self):
+        self.counts = [0] * (1 << self.BITS)
+        self.memo = {}
+
+    @classmethod
+    def hashes(cls, keys):
+        # crc32 rather than hash(): str hashes differ from process to
+        # process, and the Bloom filter bits must not depend on that.
+        codes = [zlib.crc32(key.encode("utf8")) for key in keys]
+        return tuple((code & cls.MASK, (code >> cls.BITS) & cls.MASK)
+                     for code in codes)
+
+    @staticmethod
+    def node_keys(node):
+        attributes = node.attributes
+        keys = [node.tag]
+        if "id" in attributes:
+            keys.append("#" + attributes["id"])
+        if "class" in attributes:
+            keys.extend("." + name for name in attributes["class"].split())
+        return tuple(keys)
+
+    def node_hashes(self, node):
+        keys = self.node_keys(node)
+        if keys not in self.memo:
+            self.memo[keys] = self.hashes(keys)
+        return self.memo[keys]
+
+    def push(self, node):
+        counts = self.counts
+        for first, second in self.node_hashes(node):
+            counts[first] += 1
+            counts[second] += 1
+
+    def pop(self, node):
+        counts = self.counts
+        for first, second in self.node_hashes(node):
+            counts[first] -= 1
+            counts[second] -= 1
+
+    def might_match(self, selector):
+        counts = self.counts
+        for first, second in selector.ancestor_keys:
+            if not counts[first] or not counts[second]:
+                return False
+        return True
+
 def cascade_priority(rule):
     selector, body = rule
     return selector.priority
 
+class RuleIndex:
+    # Buckets rules by the id, class or tag their rightmost selector
+    # requires, so each node is only tested against rules that could
+    # possibly match it. Rules must already be in cascade order;
+    # candidates() keeps it.
+    def __init__(self, rules):
+        self.rules = rules
+        self.by_id = {}
+        self.by_class = {}
+        self.by_tag = {}
+        self.universal = []
+        buckets = {"id": self.by_id, "class": self.by_class, "tag": self.by_tag}
+        # The attributes that can affect a node's style; see style()
+        attributes = {"style"}
+        # Whether any rule looks at ancestors; if not, style() can skip
+        # maintaining an AncestorFilter.
+        self.combinators = False
+        for order, (selector, body) in enumerate(rules):
+            attributes.update(selector.attribute_names())
+            if selector.ancestor_keys:
+                self.combinators = True
+            entry = (order, selector, body)
+            key = selector.rightmost().index_key()
+            if key is None:
+                self.universal.append(entry)
+            else:
+                kind, value = key
+                buckets[kind].setdefault(value, []).append(entry)
+        self.attributes = tuple(sorted(attributes))
+
+    def candidates(self, node):
+        if not isinstance(node, Element):
+            return ()
+        buckets = []
+        bucket = self.by_tag.get(node.tag)
+        if bucket: buckets.append(bucket)
+        if self.by_id and "id" in node.attributes:
+            bucket = self.by_id.get(node.attributes["id"])
+            if bucket: buckets.append(bucket)
+        if self.by_class and "class" in node.attributes:
+            for name in dict.fromkeys(node.attributes["class"].split()):
+                bucket = self.by_class.get(name)
+                if bucket: buckets.append(bucket)
+        if self.universal: buckets.append(self.universal)
+        if not buckets:
+            return ()
+        if len(buckets) == 1:
+            return buckets[0]
+        return heapq.merge(*buckets)
+
+class LRUCache:
+    # The least-recently-used map behind CASCADE_CACHE, PARSE_CACHE and
+    # STYLESHEET_CACHE.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key, compute):
+        # The cached value for key, computing and adding it if needed
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        value = compute()
+        self.add(key, value)
+        return value
+
+class CascadeCache:
+    # Sorting and indexing the rules is the same work for every page that
+    # links the same stylesheets, so it's done once per combination. Keys
+    # are the sheets' ids; each entry keeps its sheets alive so those ids
+    # can't be reused by other lists while it's cached.
+    def __init__(self, capacity):
+        self.entries = LRUCache(capacity)
+
+    def add(self, sheets, index):
+        key = tuple(id(sheet) for sheet in sheets)
+        self.entries.add(key, (list(sheets), index))
+
+    def rules(self, sheets):
+        def compute():
+            rules = [rule for sheet in sheets for rule in sheet]
+            return (list(sheets), RuleIndex(sorted(rules, key=cascade_priority)))
+        key = tuple(id(sheet) for sheet in sheets)
+        return self.entries.lookup(key, compute)[1]
+
+CASCADE_CACHE = CascadeCache(32)
+
+def iter_tree(tree):
+    # Pre-order, without recursion, so deeply nested pages can't hit
+    # Python's recursion limit.
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+def iter_elements(tree, tag=None):
+    for node in iter_tree(tree):
+        if isinstance(node, Element) and (tag is None or node.tag == tag):
+            yield node
+
 def print_html(node):
-    print(node)
-    for child in node.children:
-        print_html(child)
+    for descendant in iter_tree(node):
+        print(descendant)
+
+
+class HTMLTokenizer:
+    # Turns a string, or any iterable of string chunks such as an open
+    # file, into a stream of events:
+    #   ("start_tag", tag, attributes), ("end_tag", tag),
+    #   ("text", text), ("comment", text)
+    # Only the current unfinished token is buffered, so memory use does
+    # not grow with the size of the document.
+    def __init__(self, source):
+        self.source = [source] if isinstance(source, str) else source
+
+    def events(self):
+        buffer = ""
+        pos = 0
+        resume = 0
+        in_tag = False
+        for chunk in self.source:
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            while True:
+                if not in_tag:
+                    start = buffer.find("<", max(pos, resume))
+                    if start == -1: break
+                    if start > pos:
+                        yield ("text", buffer[pos:start])
+                    pos = start + 1
+                    in_tag = True
+                elif buffer.startswith("!--", pos):
+                    end = buffer.find("-->", max(pos + 3, resume - 2))
+                    if end == -1: break
+                    yield ("comment", buffer[pos + 3:end])
+                    pos = end + 3
+                    in_tag = False
+                else:
+                    end = buffer.find(">", max(pos, resume))
+                    if end == -1: break
+                    yield self.tag_event(buffer[pos:end])
+                    pos = end + 1
+                    in_tag = False
+            # Don't rescan the leftover text when the next chunk arrives
+            resume = len(buffer) - pos
+        if not in_tag and pos < len(buffer):
+            yield ("text", buffer[pos:])
+
+    def tag_event(self, text):
+        tag, attributes = self.get_attributes(text)
+        if tag.startswith("!"):
+            return ("comment", text[1:])
+        elif tag.startswith("/"):
+            return ("end_tag", tag[1:])
+        else:
+            return ("start_tag", tag, attributes)
+
+    # name, then optionally = and a "double", 'single' or bare value
+    ATTRIBUTE = re.compile(
+        r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?""")
+
+    def get_attributes(self, text):
+        parts = text.split(None, 1)
+        tag = parts[0].casefold() if parts else ""
+        if len(tag) > 1 and tag.endswith("/"):
+            tag = tag[:-1]
+        attributes = {}
+        if len(parts) < 2:
+            return tag, attributes
+        # findall measured faster than finditer here, since it doesn't
+        # make a match object per attribute. Like real browsers, the
+        # first of several duplicates wins, hence setdefault.
+        setdefault = attributes.setdefault
+        for key, double, single, bare in self.ATTRIBUTE.findall(parts[1]):
+            setdefault(key.casefold(), double or single or bare)
+        return tag, attributes
 
+def extract_links(source):
+    for event in HTMLTokenizer(source).events():
+        if event[0] == "start_tag" and "href" in event[2]:
+            yield event[2]["href"]
+
+def extract_text(source):
+    for event in HTMLTokenizer(source).events():
+        if event[0] == "text":
+            yield event[1]
+
+class DocumentIndex:
+    # Tab.load looks up <link rel=stylesheet> and <meta> here instead of
+    # walking the tree. Other attributes can still be passed to find();
+    # they're just checked on each candidate rather than bucketed.
+    ATTRIBUTES = ["rel"]
+
+    # Buckets are dicts used as ordered sets, so lookups come back in
+    # document order.
+    def __init__(self):
+        self.by_tag = {}
+        self.by_attribute = {name: {} for name in self.ATTRIBUTES}
+
+    def add(self, node):
+        self.by_tag.setdefault(node.tag, {})[node] = None
+        for name in self.ATTRIBUTES:
+            if name in node.attributes:
+                values = self.by_attribute[name]
+                values.setdefault(node.attributes[name], {})[node] = None
+
+    def find(self, tag=None, **attributes):
+        # Scan only the smallest matching bucket, so the cost is
+        # proportional to the number of candidates rather than the
+        # size of the document.
+        buckets = []
+        if tag is not None:
+            buckets.append(self.by_tag.get(tag, {}))
+        for name, value in attributes.items():
+            if name in self.by_attribute:
+                buckets.append(self.by_attribute[name].get(value, {}))
+        if not buckets:
+            buckets.append({node: None for nodes in self.by_tag.values()
+                            for node in nodes})
+        return [node for node in min(buckets, key=len)
+                if (tag is None or node.tag == tag)
+                and all(node.attributes.get(name) == value
+                        for name, value in attributes.items())]
+
+    def copy(self, copies):
+        # Re-key the index onto a cloned tree; copies maps old -> new.
+        index = DocumentIndex()
+        remap = lambda nodes: dict.fromkeys(copies[node] for node in nodes)
+        index.by_tag = {tag: remap(nodes) for tag, nodes in self.by_tag.items()}
+        index.by_attribute = {
+            name: {value: remap(nodes) for value, nodes in values.items()}
+            for name, values in self.by_attribute.items()}
+        return index
 
 class HTMLParser:
     def __init__(self, body):
         self.body = body
         self.unfinished = []
+        self.index = DocumentIndex()
 
     def parse(self):
-        text = ""
-        in_tag = False
-        for c in self.body:
-            if c == "<":
-                in_tag = True
-                if text: self.add_text(text)
-                text = ""
-            elif c == ">":
-                in_tag = False
-                self.add_tag(text)
-                # Check for refresh meta tag after parsing each tag
-                self.check_meta_refresh()
-                text = ""
-            else:
-                text += c
-        if not in_tag and text:
-            self.add_text(text)
+        for event in HTMLTokenizer(self.body).events():
+            kind = event[0]
+            if kind == "text":
+                self.add_text(event[1])
+            elif kind == "start_tag":
+                self.add_tag(event[1], event[2])
+            elif kind == "end_tag":
+                self.add_tag("/" + event[1])
         return self.finish()
 
-    def check_meta_refresh(self):
-        # Look at the most recently added tag
-        if not self.unfinished:
-            return
-        
-        node = self.unfinished[-1]
-        if not isinstance(node, Element):
-            return
-            
-        if node.tag == "meta" and \
-           node.attributes.get("http-equiv", "").lower() == "refresh":
-            print("Found refresh meta tag")
-            content = node.attributes.get("content", "")
-            if not content:
-                return
-                
-            # Parse the content attribute
-            parts = content.split(";", 1)
-            delay = int(parts[0])
-            url = parts[1].split("=", 1)[1] if len(parts) > 1 else None
-            
-            # Schedule the refresh/redirect
-            print(f"Scheduling refresh/redirect: delay={delay}, url={url}")
-            if url:
-                self.schedule_redirect(delay, url)
-            else:
-                self.schedule_refresh(delay)
-
-    def schedule_redirect(self, delay, url):
-        # Get the browser instance from the parent chain
-        node = self.unfinished[-1]
-        while node.parent:
-            node = node.parent
-        browser = node.browser
-
-        # Schedule the redirect after the delay
-        browser.window.after(delay * 1000, lambda: browser.active_tab.load(browser.active_tab.url.resolve(url)))
-
-    def schedule_refresh(self, delay):
-        # Get the browser instance from the parent chain
-        node = self.unfinished[-1]
-        while node.parent:
-            node = node.parent
-        browser = node.browser
-
-        # Schedule the page refresh after the delay
-        browser.window.after(delay * 1000, lambda: browser.active_tab.load(browser.active_tab.url))
-
-    def get_attributes(self, text):
-        parts = text.split()
-        tag = parts[0].casefold()
-        attributes = {}
-        for attrpair in parts[1:]:
-            if "=" in attrpair:
-                key, value = attrpair.split("=", 1)
-                if len(value) > 2 and value[0] in ["'", "\""]:
-                    value = value[1:-1]
-                attributes[key.casefold()] = value
-            else:
-                attributes[attrpair.casefold()] = ""
-        return tag, attributes
-
     def add_text(self, text):
         if text.isspace(): return
         self.implicit_tags(None)
         parent = self.unfinished[-1]
-        node = Text(text, parent)
-        parent.children.append(node)
+        node = self.new_text(text, parent)
+        self.append_child(parent, node)
 
     SELF_CLOSING_TAGS = [
         "area", "base", "br", "col", "embed", "hr", "img", "input",
         "link", "meta", "param", "source", "track", "wbr",
     ]
 
-    def add_tag(self, tag):
-        tag, attributes = self.get_attributes(tag)
-        if tag.startswith("!"): return
+    def add_tag(self, tag, attributes=None):
+        if attributes is None: attributes = {}
         self.implicit_tags(tag)
 
         if tag.startswith("/"):
             if len(self.unfinished) == 1: return
             node = self.unfinished.pop()
             parent = self.unfinished[-1]
-            parent.children.append(node)
+            self.append_child(parent, node)
         elif tag in self.SELF_CLOSING_TAGS:
             parent = self.unfinished[-1]
-            node = Element(tag, attributes, parent)
-            parent.children.append(node)
+            node = self.new_element(tag, attributes, parent)
+            self.append_child(parent, node)
+            self.register(node)
         else:
             parent = self.unfinished[-1] if self.unfinished else None
-            node = Element(tag, attributes, parent)
+            node = self.new_element(tag, attributes, parent)
             self.unfinished.append(node)
+            self.register(node)
+
+    def register(self, node):
+        self.index.add(node)
+
+    # Node storage hooks; ArenaHTMLParser (arena.py) overrides these to
+    # build the tree in flat arrays instead of Element/Text objects.
+    def new_element(self, tag, attributes, parent):
+        return Element(tag, attributes, parent)
+
+    def new_text(self, text, parent):
+        return Text(text, parent)
+
+    def append_child(self, parent, node):
+        parent.children.append(node)
 
     HEAD_TAGS = [
         "base", "basefont", "bgsound", "noscript",
@@ -344,43 +721,132 @@ class HTMLParser:
         while len(self.unfinished) > 1:
             node = self.unfinished.pop()
             parent = self.unfinished[-1]
-            parent.children.append(node)
+            self.append_child(parent, node)
         return self.unfinished.pop()
+
+def clone_tree(tree, copies=None):
+    # If given, copies is filled in with a mapping from old to new nodes
+    def clone(node, parent):
+        if isinstance(node, Text):
+            copy = Text(node.text, parent)
+        else:
+            copy = Element(node.tag, dict(node.attributes), parent)
+        if copies is not None:
+            copies[node] = copy
+        return copy
+
+    root = clone(tree, None)
+    stack = [(tree, root)]
+    while stack:
+        old, new = stack.pop()
+        for child in old.children:
+            copy = clone(child, new)
+            new.children.append(copy)
+            stack.append((child, copy))
+    return root
+
+class ParseCache:
+    def __init__(self, capacity):
+        self.entries = LRUCache(capacity)
+
+    def parse(self, body):
+        def compute():
+            parser = HTMLParser(body)
+            return (parser.parse(), parser.index)
+        key = hashlib.sha256(body.encode("utf8")).digest()
+        # The cached tree is never handed out, so styles and form values
+        # written by a Tab can't leak into the next visit.
+        tree, index = self.entries.lookup(key, compute)
+        copies = {}
+        tree = clone_tree(tree, copies)
+        return tree, index.copy(copies)
+
+PARSE_CACHE = ParseCache(32)
+
+META_REFRESH_DELAY = re.compile(r"\s*(-?\d+(?:\.\d*)?)\s*")
+
+def parse_meta_refresh(content):
+    # content="5" reloads after five seconds; content="0; url=/next"
+    # navigates to /next immediately. float() alone would let through
+    # "inf", "nan" and "1e400", which the timer can't take.
+    delay, _, target = content.partition(";")
+    m = META_REFRESH_DELAY.fullmatch(delay)
+    if not m: return None
+    delay = float(m.group(1))
+    if not math.isfinite(delay): return None
+    delay = max(delay, 0)
+    target = target.strip()
+    if target[:4].casefold() == "url=":
+        target = target[4:].strip()
+    return delay, target.strip("'\"") or None
     
+CSS_WHITESPACE = re.compile(r"(?:\s+|/\*(?:.*?\*/|.*\Z))*", re.S)
+CSS_WORD = re.compile(r"[\w#.%-]+")
+CSS_STRING = r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'"""
+# A declaration value runs to the next ; } or !, so "1px solid red" and
+# "url(a;b)" are one value; strings and parentheses are skipped whole.
+CSS_VALUE = re.compile(
+    r"(?:[^;}!\"'(]+|" + CSS_STRING + r"|\((?:[^)\"']|" + CSS_STRING + r")*\))+")
+# One part of a compound selector: a tag, #id, .class, [name] or
+# [name=value], or the universal *.
+CSS_SIMPLE = re.compile(
+    r"([#.]?)([\w-]+)|\[\s*([\w-]+)\s*(?:=\s*(" + CSS_STRING +
+    r"|[\w-]+)\s*)?\]|\*")
+CSS_IMPORTANT = re.compile(r"!\s*important", re.I)
+CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+# What skip_rule() has to look at: block and statement ends, plus the
+# strings and comments that might hide them.
+CSS_SKIP = re.compile(r"[{};]|" + CSS_STRING + r"|/\*(?:.*?\*/|.*\Z)", re.S)
+
 class CSSParser:
     def __init__(self, s):
         self.s = s
         self.i = 0
 
     def whitespace(self):
-        while self.i < len(self.s) and self.s[self.i].isspace():
-            self.i += 1
+        # Comments count as whitespace
+        self.i = CSS_WHITESPACE.match(self.s, self.i).end()
 
     def literal(self, literal):
-        if not (self.i < len(self.s) and self.s[self.i] == literal):
+        if not self.s.startswith(literal, self.i):
             raise Exception("Parsing error")
-        self.i += 1
+        self.i += len(literal)
 
     def word(self):
-        start = self.i
-        while self.i < len(self.s):
-            if self.s[self.i].isalnum() or self.s[self.i] in "#-.%":
-                self.i += 1
-            else:
-                break
-        return self.s[start:self.i]
-    
+        # Raising on an empty match makes body() drop a declaration
+        # with no property name, like ": red", rather than keep ""
+        m = CSS_WORD.match(self.s, self.i)
+        if not m:
+            raise Exception("Parsing error")
+        self.i = m.end()
+        return m.group()
+
+    def value(self):
+        m = CSS_VALUE.match(self.s, self.i)
+        if not m:
+            raise Exception("Parsing error")
+        self.i = m.end()
+        value = CSS_COMMENT.sub(" ", m.group()).strip()
+        if not value:
+            raise Exception("Parsing error")
+        # Importance isn't part of the cascade here, so it's dropped
+        m = CSS_IMPORTANT.match(self.s, self.i)
+        if m:
+            self.i = m.end()
+        return value
+
     def pair(self):
         prop = self.word()
         self.whitespace()
         self.literal(":")
         self.whitespace()
-        value = self.word()
+        value = self.value()
 
         return prop.casefold(), value
     
     def body(self):
         pairs = {}
+        self.whitespace()
         while self.i < len(self.s) and self.s[self.i] != "}":
             try:
                 prop, value = self.pair()
@@ -398,81 +864,344 @@ class CSSParser:
         return pairs
     
     def ignore_until(self, chars):
-        while self.i < len(self.s):
-            if self.s[self.i] in chars:
-                return self.s[self.i]
-            else:
-                self.i += 1
-
-        return None
+        found = [i for i in (self.s.find(c, self.i) for c in chars) if i >= 0]
+        if not found:
+            self.i = len(self.s)
+            return None
+        self.i = min(found)
+        return self.s[self.i]
+
+    def skip_rule(self):
+        # Skips a rule we can't parse, including any nested blocks, so
+        # "@media screen { a { ... } }" doesn't leave a stray "}" behind
+        # and "@import url(x);" doesn't swallow the rule after it.
+        depth = 0
+        for m in CSS_SKIP.finditer(self.s, self.i):
+            token = m.group()
+            if token == "{":
+                depth += 1
+            elif token == "}":
+                depth -= 1
+                if depth <= 0:
+                    self.i = m.end()
+                    return
+            elif token == ";" and depth == 0:
+                self.i = m.end()
+                return
+        self.i = len(self.s)
     
+    def simple_selector(self):
+        tag = None
+        ids, classes, attributes = [], [], []
+        start = self.i
+        while True:
+            m = CSS_SIMPLE.match(self.s, self.i)
+            if not m: break
+            self.i = m.end()
+            prefix, name, attribute, value = m.groups()
+            if prefix == "#":
+                ids.append(name)
+            elif prefix == ".":
+                classes.append(name)
+            elif name is not None:
+                tag = name.casefold()
+            elif attribute is not None:
+                if value is not None and value[0] in "\"'":
+                    value = value[1:-1]
+                attributes.append((attribute.casefold(), value))
+        if self.i == start:
+            raise Exception("Parsing error")
+        if tag is not None and not (ids or classes or attributes):
+            return TagSelector(tag)
+        return CompoundSelector(tag, ids, classes, attributes)
+
     def selector(self):
-        out = TagSelector(self.word().casefold())
+        out = self.simple_selector()
         self.whitespace()
-        while self.i < len(self.s) and self.s[self.i] != "{":
-            tag = self.word()
-            descendant = TagSelector(tag.casefold())
-            out = DescendantSelector(out, descendant)
+        while self.i < len(self.s) and self.s[self.i] not in "{,":
+            if self.s[self.i] == ">":
+                self.i += 1
+                self.whitespace()
+                out = ChildSelector(out, self.simple_selector())
+            else:
+                out = DescendantSelector(out, self.simple_selector())
             self.whitespace()
         return out
+
+    def selectors(self):
+        # "h1, h2 { ... }" is one rule per selector, sharing a body
+        out = [self.selector()]
+        while self.i < len(self.s) and self.s[self.i] == ",":
+            self.i += 1
+            self.whitespace()
+            out.append(self.selector())
+        return out
     
     def parse(self):
         rules = []
+        self.whitespace()
         while self.i < len(self.s):
             try:
-                self.whitespace()
-                selector = self.selector()
+                selectors = self.selectors()
                 self.literal("{")
                 self.whitespace()
                 body = self.body()
                 self.literal("}")
-                rules.append((selector, body))
+                for selector in selectors:
+                    rules.append((selector, body))
             except Exception as e:
                 # print(f"Error parsing CSS: {e}")
-                why = self.ignore_until(["}"])
-                if why == "}":
-                    self.literal("}")
-                    self.whitespace()
-                else:
-                    break
+                self.skip_rule()
+            self.whitespace()
         return rules
     
+@functools.lru_cache(maxsize=4096)
+def parse_inline_style(text):
+    # Generated pages repeat the same style="" strings thousands of times.
+    # Items come back as a tuple so callers can't modify the cached value.
+    return tuple(CSSParser(text).body().items())
+
+class StylesheetCache:
+    # Parsed rule lists by stylesheet URL and content hash, shared by every
+    # tab. Pages on one site usually link the same CSS, so navigating
+    # between them re-parses nothing, and because the same list comes back
+    # each time CASCADE_CACHE can reuse its sorted index as well.
+    def __init__(self, capacity):
+        self.entries = LRUCache(capacity)
+
+    def parse(self, url, body):
+        key = (str(url), hashlib.sha256(body.encode("utf8")).digest())
+        return self.entries.lookup(key, lambda: CSSParser(body).parse())
+
+STYLESHEET_CACHE = StylesheetCache(64)
+
 INHERITED_PROPERTIES = {
     "font-size": "16px",
     "font-style": "normal",
     "font-weight": "normal",
     "color": "black",
 }
-    
-def style(node, rules):
-    node.style = {}
-    for property, default_value in INHERITED_PROPERTIES.items():
-        if node.parent:
-            node.style[property] = node.parent.style[property]
+
+def parse_px(value, default=16.0):
+    # "16px" -> 16.0. Units we don't support fall back to the default
+    # rather than reaching layout as strings.
+    if value and value.endswith("px"):
+        value = value[:-2]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+class ComputedStyle:
+    # An immutable, read-only mapping of property -> value. Instances
+    # are interned, so structurally identical styles are one object, and
+    # each caches the inherited-only style its children start from.
+    #
+    # The values layout needs are also resolved once here rather than
+    # for every word: font_size in px, font_weight and font_slant as Tk
+    # wants them, color, and the font itself (looked up on first use).
+    __slots__ = ("properties", "inherited_style", "font_size",
+                 "font_weight", "font_slant", "color", "_font",
+                 "__weakref__")
+    INTERNED = weakref.WeakValueDictionary()
+
+    @classmethod
+    def intern(cls, properties):
+        key = frozenset(properties.items())
+        computed = cls.INTERNED.get(key)
+        if computed is None:
+            computed = object.__new__(cls)
+            computed.properties = dict(properties)
+            computed.inherited_style = None
+            computed.resolve()
+            cls.INTERNED[key] = computed
+        return computed
+
+    def resolve(self):
+        self.font_size = parse_px(self.properties.get("font-size"))
+        weight = self.properties.get("font-weight", "normal")
+        if weight.isdigit():
+            self.font_weight = "bold" if int(weight) >= 600 else "normal"
         else:
-            node.style[property] = default_value
+            self.font_weight = "bold" if weight in ("bold", "bolder") \
+                else "normal"
+        style = self.properties.get("font-style", "normal")
+        self.font_slant = "italic" if style in ("italic", "oblique") \
+            else "roman"
+        self.color = self.properties.get("color", "black")
+        self._font = None
 
-    for selector, body in rules:
-        if not selector.matches(node): continue
-        for property, value in body.items():
-            node.style[property] = value
+    @property
+    def font(self):
+        if self._font is None:
+            self._font = get_font(int(self.font_size * .75),
+                                  self.font_weight, self.font_slant)
+        return self._font
 
-    if isinstance(node, Element) and "style" in node.attributes:
-        pairs = CSSParser(node.attributes["style"]).body()
-        for prop, value in pairs.items():
-            node.style[prop] = value
+    def inherited(self):
+        if self.inherited_style is None:
+            self.inherited_style = ComputedStyle.intern(
+                {property: self.properties[property]
+                 for property in INHERITED_PROPERTIES})
+        return self.inherited_style
 
-    if node.style["font-size"].endswith("%"):
-        if node.parent:
-            parent_font_size = node.parent.style["font-size"]
-        else:
-            parent_font_size = INHERITED_PROPERTIES["font-size"]
-        node_pct = float(node.style["font-size"][:-1]) / 100
-        parent_px = float(parent_font_size[:-2])
-        node.style['font-size'] = str(node_pct * parent_px) + "px"
+    def __reduce__(self):
+        return (ComputedStyle.intern, (self.properties,))
+
+    def __getitem__(self, property):
+        return self.properties[property]
+
+    def __contains__(self, property):
+        return property in self.properties
+
+    def __iter__(self):
+        return iter(self.properties)
+
+    def __len__(self):
+        return len(self.properties)
+
+    def get(self, property, default=None):
+        return self.properties.get(property, default)
+
+    def keys(self):
+        return self.properties.keys()
+
+    def items(self):
+        return self.properties.items()
+
+    def __repr__(self):
+        return "ComputedStyle({!r})".format(self.properties)
+
+INITIAL_STYLE = ComputedStyle.intern(INHERITED_PROPERTIES)
     
-    for child in node.children:
-        style(child, rules)
+class SelectorStats:
+    __slots__ = ("attempts", "filtered", "matches", "steps", "seconds")
+
+    def __init__(self):
+        self.attempts = 0
+        self.filtered = 0  # rejected by the AncestorFilter, never walked
+        self.matches = 0
+        self.steps = 0     # ancestors visited by descendant/child selectors
+        self.seconds = 0.0
+
+class StyleProfile:
+    # Opt-in cascade profiling: pass one to style() and call report()
+    # to see which selectors the time went to. Nodes that reuse a shared
+    # style never reach style_node(), so they cost nothing here either.
+    def __init__(self):
+        self.stats = {}
+        self.nodes = 0
+
+    def matches(self, selector, node, ancestors):
+        stats = self.stats.get(selector)
+        if stats is None:
+            stats = self.stats[selector] = SelectorStats()
+        stats.attempts += 1
+        start = time.perf_counter()
+        if ancestors is not None and not ancestors.might_match(selector):
+            stats.filtered += 1
+            matched = False
+        else:
+            matched = selector.matches(node, stats)
+        stats.seconds += time.perf_counter() - start
+        if matched:
+            stats.matches += 1
+        return matched
+
+    def report(self, limit=20, file=None):
+        rows = sorted(self.stats.items(),
+                      key=lambda item: item[1].seconds, reverse=True)
+        total = sum(stats.seconds for stats in self.stats.values())
+        print("{} selectors, {:.1f} ms matching".format(
+            len(rows), total * 1000), file=file)
+        print("{:>9} {:>9} {:>9} {:>9} {:>9}  {}".format(
+            "ms", "attempts", "matches", "filtered", "steps", "selector"),
+            file=file)
+        for selector, stats in rows[:limit]:
+            print("{:9.2f} {:9} {:9} {:9} {:9}  {}".format(
+                stats.seconds * 1000, stats.attempts, stats.matches,
+                stats.filtered, stats.steps, selector), file=file)
+
+def style(tree, rules, profile=None):
+    if isinstance(rules, list):
+        rules = RuleIndex(rules)
+    ancestors = AncestorFilter() if rules.combinators else None
+    if ancestors is not None:
+        # Styling a subtree: its ancestors are already in the document
+        chain = []
+        parent = tree.parent
+        while parent:
+            chain.append(parent)
+            parent = parent.parent
+        for node in reversed(chain):
+            ancestors.push(node)
+    # Style sharing: selectors only look at a node's own tag and
+    # attributes and at its ancestors, so two nodes with the same tag and
+    # the same values for every attribute the rules mention, under
+    # equivalent parents, always get the same style. Each equivalence
+    # class gets a small integer id; a node's key is its parent's id plus
+    # its own tag and attribute values, which covers siblings and cousins
+    # alike.
+    shared = {}
+    names = rules.attributes
+    # Pre-order, with an exit marker after each element's children so
+    # the filter holds exactly the current node's ancestors.
+    stack = [(tree, False, None)]
+    while stack:
+        node, leaving, parent_id = stack.pop()
+        if leaving:
+            if ancestors is not None: ancestors.pop(node)
+            continue
+        if isinstance(node, Text):
+            key = (parent_id,)
+        else:
+            key = (parent_id, node.tag) + \
+                tuple(map(node.attributes.get, names))
+        entry = shared.get(key)
+        if entry is None:
+            style_node(node, rules, ancestors, profile)
+            entry = shared[key] = (len(shared), node.style)
+        else:
+            node.style = entry[1]
+        if node.children:
+            if ancestors is not None:
+                ancestors.push(node)
+                stack.append((node, True, None))
+            stack.extend([(child, False, entry[0])
+                          for child in reversed(node.children)])
+
+def style_node(node, rules, ancestors=None, profile=None):
+    parent_style = node.parent.style if node.parent else INITIAL_STYLE
+
+    changes = None
+    for order, selector, body in rules.candidates(node):
+        if profile is not None:
+            if not profile.matches(selector, node, ancestors): continue
+        else:
+            if ancestors is not None and not ancestors.might_match(selector):
+                continue
+            if not selector.matches(node): continue
+        if changes is None: changes = {}
+        changes.update(body)
+
+    if isinstance(node, Element) and "style" in node.attributes:
+        pairs = parse_inline_style(node.attributes["style"])
+        if changes is None: changes = {}
+        changes.update(pairs)
+
+    # Copy-on-write: a node nothing applies to (every Text node, for
+    # one) just takes its parent's inherited values without a new dict.
+    if not changes:
+        node.style = parent_style.inherited()
+        return
+
+    properties = dict(parent_style.inherited().properties)
+    properties.update(changes)
+    if properties["font-size"].endswith("%"):
+        node_pct = parse_px(properties["font-size"][:-1], 100) / 100
+        parent_px = parent_style.font_size
+        properties["font-size"] = str(node_pct * parent_px) + "px"
+    node.style = ComputedStyle.intern(properties)
 
 
 BLOCK_ELEMENTS = [
@@ -485,15 +1214,11 @@ BLOCK_ELEMENTS = [
 ]
 
 def paint_tree(layout_object, display_list):
-    display_list.extend(layout_object.paint())
-
-    for child in layout_object.children:
-        paint_tree(child, display_list)
+    for obj in iter_tree(layout_object):
+        display_list.extend(obj.paint())
 
 def tree_to_list(tree, list):
-    list.append(tree)
-    for child in tree.children:
-        tree_to_list(child, list)
+    list.extend(iter_tree(tree))
     return list
 
 class DrawText: 
@@ -561,12 +1286,7 @@ class TextLayout:
         self.previous = previous
 
     def layout(self):
-        weight = self.node.style['font-weight']
-        style = self.node.style['font-style']
-        if style == 'normal':
-            style = 'roman'
-        size = int(float(self.node.style['font-size'][:-2]) * .75)
-        self.font = get_font(size, weight, style)
+        self.font = self.node.style.font
 
         self.width = self.font.measure(self.word)
 
@@ -579,7 +1299,7 @@ class TextLayout:
         self.height = self.font.metrics("linespace")
 
     def paint(self):
-        color = self.node.style["color"]
+        color = self.node.style.color
         return [DrawText(self.x, self.y, self.word, self.font, color)]
 
 class BlockLayout:
@@ -619,6 +1339,28 @@ class BlockLayout:
         return cmds
     
     def layout(self):
+        # Lays out the whole subtree without recursion, so deeply nested
+        # pages can't hit Python's recursion limit. A block's height is
+        # summed once everything below it is done, and each child block
+        # finishes before the next starts since its y needs the
+        # previous one's height.
+        stack = [(self, False)]
+        while stack:
+            block, done = stack.pop()
+            if done:
+                block.height = sum([child.height for child in block.children])
+                continue
+            stack.append((block, True))
+            if block.layout_children():
+                stack.extend((child, False)
+                             for child in reversed(block.children))
+            else:
+                for line in block.children:
+                    line.layout()
+
+    def layout_children(self):
+        # Places this block and creates its children. Returns True if
+        # they are blocks, which layout() still has to lay out.
         self.x = self.parent.x
         self.width = self.parent.width
 
@@ -634,14 +1376,11 @@ class BlockLayout:
                 next = BlockLayout(child, self, previous)
                 self.children.append(next)
                 previous = next
+            return True
         else:
             self.new_line()
             self.recurse(self.node)
-      
-        for child in self.children:
-            child.layout()
-
-        self.height = sum([child.height for child in self.children])
+            return False
 
     def layout_mode(self):
         if isinstance(self.node, Text):
@@ -657,11 +1396,7 @@ class BlockLayout:
         
 
     def word(self, node, word):
-        weight = node.style["font-weight"]
-        style = node.style["font-style"]
-        if style == "normal": style = "roman"
-        size = int(float(node.style["font-size"][:-2]) * .75)
-        font = get_font(size, weight, style)
+        font = node.style.font
 
         w = font.measure(word)
         if self.cursor_x + w > self.width:
@@ -679,12 +1414,10 @@ class BlockLayout:
         self.children.append(new_line)
 
     def recurse(self, node):
-        if isinstance(node, Text):
-            for word in node.text.split():
-                self.word(node, word)
-        else:
-            for child in node.children:
-                self.recurse(child)
+        for node in iter_tree(node):
+            if isinstance(node, Text):
+                for word in node.text.split():
+                    self.word(node, word)
 
 class DocumentLayout:
     def __init__(self, node):
@@ -707,15 +1440,26 @@ class DocumentLayout:
     def paint(self):
         return []
     
-DEFAULT_STYLE_SHEET = CSSParser(open("browser.css").read()).parse()
+STYLE_SHEET_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "browser.css")
+
+def load_default_style_sheet(path=STYLE_SHEET_PATH):
+    with open(path, encoding="utf8") as f:
+        rules = CSSParser(f.read()).parse()
+    return rules, RuleIndex(sorted(rules, key=cascade_priority))
+
+DEFAULT_STYLE_SHEET, DEFAULT_RULES = load_default_style_sheet()
+CASCADE_CACHE.add([DEFAULT_STYLE_SHEET], DEFAULT_RULES)
 class Tab:
-    def __init__(self, tab_height):
+    def __init__(self, tab_height, browser=None):
         self.scroll = 0
         self.display_list = []
         self.url = None
         self.tab_height = tab_height
         self.history = []
         self.history_index = -1
+        self.browser = browser
+        self.refresh_timer = None
 
     def __repr__(self):
         return f"Tab(url: {self.url}, height: {self.tab_height})"
@@ -723,11 +1467,12 @@ class Tab:
     def click(self, x, y):
         y += self.scroll
 
-        objs = [obj for obj in tree_to_list(self.document, [])
-                if obj.x <= x < obj.x + obj.width
-                and obj.y <= y < obj.y + obj.height]
-        if not objs: return
-        elt = objs[-1].node
+        elt = None
+        for obj in iter_tree(self.document):
+            if obj.x <= x < obj.x + obj.width \
+               and obj.y <= y < obj.y + obj.height:
+                elt = obj.node
+        if elt is None: return
         while elt:
             if isinstance(elt, Text):
                 pass
@@ -751,33 +1496,58 @@ class Tab:
         if update_history:
             self.history.append(url)
         body = url.request()
-        self.nodes = HTMLParser(body).parse()
+        self.nodes, self.index = PARSE_CACHE.parse(body)
 
         ## Applying styles
-        rules = DEFAULT_STYLE_SHEET.copy()
+        sheets = [DEFAULT_STYLE_SHEET]
         links = [node.attributes["href"]
-                 for node in tree_to_list(self.nodes, [])
-                 if isinstance(node, Element)
-                 and node.tag == "link"
-                 and node.attributes.get("rel") == "stylesheet"
-                 and "href" in node.attributes]
-        
-        # Debug this later. Right now, it causes the browser to freeze.
-        # for link in links:
-        #     try:
-        #         style_url = url.resolve(link)
-        #         style_body = style_url.request()
-        #         rules.extend(CSSParser(style_body).parse())
-        #     except Exception as e:
-        #         print(f"Error loading stylesheet {link}: {e}")
-        #         continue
-
-        style(self.nodes, sorted(rules, key=cascade_priority))
+                 for node in self.index.find("link", rel="stylesheet")
+                 if "href" in node.attributes]
+        refresh = None
+        for node in self.index.find("meta"):
+            if node.attributes.get("http-equiv", "").casefold() == "refresh":
+                refresh = parse_meta_refresh(node.attributes.get("content", ""))
+                break
+
+        for link in links:
+            try:
+                style_url = url.resolve(link)
+                style_body = style_url.request()
+            except Exception as e:
+                print(f"Error loading stylesheet {link}: {e}")
+                continue
+            sheets.append(STYLESHEET_CACHE.parse(style_url, style_body))
+
+        style(self.nodes, CASCADE_CACHE.rules(sheets))
 
         self.document = DocumentLayout(self.nodes)
         self.document.layout()
         self.display_list = []
         paint_tree(self.document, self.display_list)
+        self.schedule_refresh(refresh)
+
+    def schedule_refresh(self, refresh):
+        if self.refresh_timer:
+            self.browser.window.after_cancel(self.refresh_timer)
+            self.refresh_timer = None
+        if not refresh or not self.browser: return
+        delay, target = refresh
+        if target:
+            url = self.url.resolve(target)
+            action = lambda: self.refresh(url)
+        else:
+            action = lambda: self.refresh(self.url, False)
+        # Tk rejects delays past a machine integer; 2**31 ms is 24 days.
+        delay = min(int(delay * 1000), 2**31 - 1)
+        self.refresh_timer = self.browser.window.after(delay, action)
+
+    def refresh(self, url, update_history=True):
+        # Timers fire outside any input event, so nothing else would
+        # redraw the canvas with the new page
+        self.refresh_timer = None
+        self.load(url, update_history)
+        if self.browser.active_tab is self:
+            self.browser.draw()
 
     def draw(self, canvas, offset):
         canvas.delete("all")
@@ -818,7 +1588,7 @@ class Browser:
 
 
     def new_tab(self, url):
-        tab = Tab(HEIGHT - self.chrome.bottom)
+        tab = Tab(HEIGHT - self.chrome.bottom, self)
         tab.load(url)
         self.active_tab = tab
         self.tabs.append(tab)
@@ -1,3 +1,4 @@
+import os
 import socket
 import ssl
 import tkinter
@@ -596,7 +597,8 @@ class DocumentLayout:
     def paint(self):
         return []
     
-DEFAULT_STYLE_SHEET = CSSParser(open("browser.css").read()).parse()
+DEFAULT_STYLE_SHEET = CSSParser(open(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "browser.css")).read()).parse()
 class Browser:
     def __init__(self):
         self.window = tkinter.Tk()
@@ -283,7 +283,8 @@ class DrawText:
             anchor='nw',
             fill=self.color)
 
-DEFAULT_STYLE_SHEET = CSSParser(open("browser.css").read()).parse()
+DEFAULT_STYLE_SHEET = CSSParser(open(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "browser.css")).read()).parse()
 
 @wbetools.patch(Browser)
 class Browser:
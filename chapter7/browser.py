@@ -1,3 +1,4 @@
+import os
 import socket
 import ssl
 import tkinter
@@ -704,7 +705,8 @@ class DocumentLayout:
     def paint(self):
         return []
     
-DEFAULT_STYLE_SHEET = CSSParser(open("browser.css").read()).parse()
+DEFAULT_STYLE_SHEET = CSSParser(open(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "browser.css")).read()).parse()
 class Tab:
     def __init__(self, tab_height):
         self.scroll = 0
@@ -9,6 +9,7 @@ import ssl
 import tkinter
 import tkinter.font
 import urllib.parse
+import weakref
 
 import sys
 import os
@@ -20,10 +21,61 @@ from chapter3.browser_no_exercises import FONTS, get_font
 from chapter4.browser_no_exercises import Text, Element, print_tree, HTMLParser
 from chapter5.browser_no_exercises import BLOCK_ELEMENTS, DocumentLayout
 from chapter6.browser_no_exercises import CSSParser, TagSelector, DescendantSelector
-from chapter6.browser_no_exercises import INHERITED_PROPERTIES, style, cascade_priority, tree_to_list
+from chapter6.browser_no_exercises import INHERITED_PROPERTIES, cascade_priority, tree_to_list
 from chapter7.browser_no_exercises import DrawText, DrawLine, DrawOutline, BlockLayout, LineLayout, TextLayout
 from chapter7.browser_no_exercises import URL, Tab, Browser, Chrome, DrawRect, Rect
 
+class ProtectedField:
+    # A value derived from other fields. read() records who derived
+    # something from it, set() marks them dirty only when the value
+    # actually changes, and a dirty field flags has_dirty_descendants on
+    # its parent fields so restyle() can walk straight down to it. Only
+    # styles are tracked this way; layout objects are rebuilt every
+    # frame, so there is nothing to invalidate there.
+    def __init__(self, obj, name, parent=None):
+        self.obj = obj
+        self.name = name
+        self.parent = parent
+        self.value = None
+        self.dirty = True
+        self.has_dirty_descendants = False
+        # Nodes removed from the page shouldn't be kept alive just
+        # because they once read this field.
+        self.invalidations = weakref.WeakSet()
+        self.set_ancestor_dirty_bits()
+
+    def set_ancestor_dirty_bits(self):
+        parent = self.parent
+        while parent and not parent.has_dirty_descendants:
+            parent.has_dirty_descendants = True
+            parent = parent.parent
+
+    def mark(self):
+        if self.dirty: return
+        self.dirty = True
+        self.set_ancestor_dirty_bits()
+
+    def notify(self):
+        for field in list(self.invalidations):
+            field.mark()
+
+    def set(self, value):
+        if value != self.value:
+            self.notify()
+        self.value = value
+        self.dirty = False
+
+    def get(self):
+        assert not self.dirty, "{} read while dirty".format(self)
+        return self.value
+
+    def read(self, notify):
+        self.invalidations.add(notify)
+        return self.get()
+
+    def __repr__(self):
+        return "ProtectedField({}, {})".format(self.obj, self.name)
+
 @wbetools.patch(Element)
 class Element:
     def __init__(self, tag, attributes, parent):
@@ -33,6 +85,11 @@ class Element:
         self.parent = parent
         self.style = {}
         self.is_focused = False
+        self.style_field = ProtectedField(self, "style",
+            parent.style_field if parent else None)
+        # What children inherit, kept apart from the full style so a
+        # change to, say, background-color doesn't restyle them.
+        self.inherited_field = ProtectedField(self, "inherited")
 
 @wbetools.patch(Text)
 class Text:
@@ -42,6 +99,82 @@ class Text:
         self.parent = parent
         self.style = {}
         self.is_focused = False
+        self.style_field = ProtectedField(self, "style",
+            parent.style_field if parent else None)
+        self.inherited_field = ProtectedField(self, "inherited")
+
+def style_node(node, rules):
+    # Chapter 6's style(), for one node and without recursing
+    if node.parent:
+        inherited = node.parent.inherited_field.read(notify=node.style_field)
+    else:
+        inherited = INHERITED_PROPERTIES
+    node.style = dict(inherited)
+    for selector, body in rules:
+        if not selector.matches(node): continue
+        for property, value in body.items():
+            node.style[property] = value
+    if isinstance(node, Element) and "style" in node.attributes:
+        pairs = CSSParser(node.attributes["style"]).body()
+        for property, value in pairs.items():
+            node.style[property] = value
+    if node.style["font-size"].endswith("%"):
+        parent_font_size = inherited["font-size"]
+        node_pct = float(node.style["font-size"][:-1]) / 100
+        parent_px = float(parent_font_size[:-2])
+        node.style["font-size"] = str(node_pct * parent_px) + "px"
+    node.font = style_font(node.style)
+    node.style_field.set(node.style)
+    node.inherited_field.set(
+        {property: node.style[property] for property in INHERITED_PROPERTIES})
+
+STYLE_FONTS = {}
+def style_font(style):
+    # Resolved when a node is restyled, so layout just reads node.font
+    # instead of parsing font-size for every word.
+    key = (style["font-size"], style["font-weight"], style["font-style"])
+    if key not in STYLE_FONTS:
+        size, weight, slant = key
+        if slant == "normal": slant = "roman"
+        STYLE_FONTS[key] = get_font(int(float(size[:-2]) * .75), weight, slant)
+    return STYLE_FONTS[key]
+
+def set_attribute(node, name, value):
+    node.attributes[name] = value
+    # Selectors here only look at tags, so of all attributes only an
+    # inline style can change a node's style.
+    if name == "style":
+        node.style_field.mark()
+
+def restyle(tree, rules):
+    # An exit marker after each subtree clears has_dirty_descendants
+    # only once everything below has been restyled; nodes restyled on
+    # the way down can dirty their children, and that shouldn't leave
+    # flags set above them.
+    stack = [(tree, False)]
+    while stack:
+        node, leaving = stack.pop()
+        field = node.style_field
+        if leaving:
+            field.has_dirty_descendants = False
+            continue
+        if field.dirty:
+            style_node(node, rules)
+        if field.has_dirty_descendants:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+
+def assert_clean(tree):
+    for node in tree_to_list(tree, []):
+        field = node.style_field
+        assert not field.dirty and not field.has_dirty_descendants, \
+            "{} is stale after render".format(field)
+
+def print_dependencies(tree):
+    for node in tree_to_list(tree, []):
+        for field in (node.style_field, node.inherited_field):
+            for dependent in field.invalidations:
+                print("Dependency: {} -> {}".format(field, dependent))
 
 @wbetools.patch(URL)
 class URL:
@@ -85,7 +218,8 @@ class URL:
         s.close()
         return content
 
-DEFAULT_STYLE_SHEET = CSSParser(open("browser.css").read()).parse()
+DEFAULT_STYLE_SHEET = CSSParser(open(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "browser.css")).read()).parse()
 
 INPUT_WIDTH_PX = 200
 
@@ -102,11 +236,7 @@ class InputLayout:
         self.font = None
 
     def layout(self):
-        weight = self.node.style["font-weight"]
-        style = self.node.style["font-style"]
-        if style == "normal": style = "roman"
-        size = int(float(self.node.style["font-size"][:-2]) * .75)
-        self.font = get_font(size, weight, style)
+        self.font = self.node.font
 
         self.width = INPUT_WIDTH_PX
 
@@ -174,6 +304,20 @@ class LineLayout:
 
 @wbetools.patch(TextLayout)
 class TextLayout:
+    def layout(self):
+        self.font = self.node.font
+
+        # Do not set self.y!!!
+        self.width = self.font.measure(self.word)
+
+        if self.previous:
+            space = self.previous.font.measure(" ")
+            self.x = self.previous.x + space + self.previous.width
+        else:
+            self.x = self.parent.x
+
+        self.height = self.font.metrics("linespace")
+
     def should_paint(self):
         return True
 
@@ -213,12 +357,17 @@ class BlockLayout:
         input = InputLayout(node, line, previous_word)
         line.children.append(input)
 
-        weight = node.style["font-weight"]
-        style = node.style["font-style"]
-        if style == "normal": style = "roman"
-        size = int(float(node.style["font-size"][:-2]) * .75)
-        font = get_font(size, weight, style)
+        self.cursor_x += w + node.font.measure(" ")
 
+    def word(self, node, word):
+        font = node.font
+        w = font.measure(word)
+        if self.cursor_x + w > self.width:
+            self.new_line()
+        line = self.children[-1]
+        previous_word = line.children[-1] if line.children else None
+        text = TextLayout(node, word, line, previous_word)
+        line.children.append(text)
         self.cursor_x += w + font.measure(" ")
 
     def should_paint(self):
@@ -262,22 +411,36 @@ class Tab:
         self.nodes = HTMLParser(body).parse()
 
         self.rules = DEFAULT_STYLE_SHEET.copy()
-        links = [node.attributes["href"]
-                 for node in tree_to_list(self.nodes, [])
-                 if isinstance(node, Element)
-                 and node.tag == "link"
-                 and node.attributes.get("rel") == "stylesheet"
-                 and "href" in node.attributes]
+        links = []
+        self.form_inputs = {}
+        for node in tree_to_list(self.nodes, []):
+            if not isinstance(node, Element): continue
+            if node.tag == "link" \
+               and node.attributes.get("rel") == "stylesheet" \
+               and "href" in node.attributes:
+                links.append(node.attributes["href"])
+            elif node.tag == "input" and "name" in node.attributes:
+                form = node.parent
+                while form and form.tag != "form":
+                    form = form.parent
+                if form:
+                    self.form_inputs.setdefault(form, []).append(node)
         for link in links:
             try:
                 body = url.resolve(link).request()
             except:
                 continue
             self.rules.extend(CSSParser(body).parse())
+        # Sorted once here; render() runs on every keystroke
+        self.rules.sort(key=cascade_priority)
         self.render()
 
     def render(self):
-        style(self.nodes, sorted(self.rules, key=cascade_priority))
+        restyle(self.nodes, self.rules)
+        if wbetools.ASSERT_LAYOUT_CLEAN:
+            assert_clean(self.nodes)
+        if wbetools.PRINT_INVALIDATION_DEPENDENCIES:
+            print_dependencies(self.nodes)
         self.document = DocumentLayout(self.nodes)
         self.document.layout()
         self.display_list = []
@@ -298,7 +461,7 @@ class Tab:
                 url = self.url.resolve(elt.attributes["href"])
                 return self.load(url)
             elif elt.tag == "input":
-                elt.attributes["value"] = ""
+                set_attribute(elt, "value", "")
                 if self.focus:
                     self.focus.is_focused = False
                 self.focus = elt
@@ -312,10 +475,7 @@ class Tab:
             elt = elt.parent
 
     def submit_form(self, elt):
-        inputs = [node for node in tree_to_list(elt, [])
-                  if isinstance(node, Element)
-                  and node.tag == "input"
-                  and "name" in node.attributes]
+        inputs = self.form_inputs.get(elt, [])
 
         body = ""
         for input in inputs:
@@ -331,7 +491,8 @@ class Tab:
 
     def keypress(self, char):
         if self.focus:
-            self.focus.attributes["value"] += char
+            value = self.focus.attributes["value"] + char
+            set_attribute(self.focus, "value", value)
             self.render()
 
 @wbetools.patch(Chrome)
@@ -389,5 +550,6 @@ class Browser:
 
 if __name__ == "__main__":
     import sys
+    wbetools.parse_flags()
     Browser().new_tab(URL(sys.argv[1]))
     tkinter.mainloop()
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+A compact binary format for parsed DOM trees and their computed styles.
+
+dumps(tree) walks the tree iteratively and returns bytes; loads(data)
+rebuilds Element/Text nodes, parent pointers included. Neither side
+recurses, so arbitrarily deep documents round-trip, unlike pickle.
+
+Layout (all integers are little-endian uint32):
+
+    b"WBED" version
+    counts: strings, style ints, record ints, text bytes
+    string lengths (in characters)
+    styles:  per style, pair count then (property, value) string ids
+    records: per node in pre-order, either
+             ELEMENT tag n_attributes (key value)* n_children style
+             TEXT    text style
+             where style is 0 for "none" or 1 + a style index
+    every string, UTF-8 encoded and concatenated
+"""
+
+import struct
+import sys
+from array import array
+
+from browser import ComputedStyle, Element, Text
+
+MAGIC = b"WBED"
+VERSION = 1
+ELEMENT, TEXT = 0, 1
+
+HEADER = struct.Struct("<4sB4I")
+
+def _to_bytes(ints):
+    if sys.byteorder == "big":
+        ints = array("I", ints)
+        ints.byteswap()
+    return ints.tobytes()
+
+def _from_bytes(data, start, count):
+    ints = array("I")
+    ints.frombytes(data[start:start + 4 * count])
+    if sys.byteorder == "big":
+        ints.byteswap()
+    return ints, start + 4 * count
+
+def dumps(tree):
+    strings = {}
+    styles = {}
+    style_ints = array("I")
+    records = array("I")
+
+    def string_id(s):
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    def style_id(node):
+        computed = getattr(node, "style", None)
+        if computed is None:
+            return 0
+        # Computed styles are interned, so identity is equality
+        if computed not in styles:
+            styles[computed] = len(styles)
+            style_ints.append(len(computed))
+            for prop, value in computed.items():
+                style_ints.append(string_id(prop))
+                style_ints.append(string_id(value))
+        return styles[computed] + 1
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Text):
+            records.extend((TEXT, string_id(node.text), style_id(node)))
+            continue
+        children = node.children
+        attributes = node.attributes
+        records.append(ELEMENT)
+        records.append(string_id(node.tag))
+        records.append(len(attributes))
+        for key, value in attributes.items():
+            records.append(string_id(key))
+            records.append(string_id(value))
+        records.append(len(children))
+        records.append(style_id(node))
+        stack.extend(reversed(children))
+
+    lengths = array("I", [len(s) for s in strings])
+    blob = "".join(strings).encode("utf8")
+    return b"".join([
+        HEADER.pack(MAGIC, VERSION,
+            len(lengths), len(style_ints), len(records), len(blob)),
+        _to_bytes(lengths), _to_bytes(style_ints), _to_bytes(records), blob,
+    ])
+
+def loads(data):
+    magic, version, n_strings, n_style_ints, n_records, n_blob = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a serialized DOM tree")
+    lengths, pos = _from_bytes(data, HEADER.size, n_strings)
+    style_ints, pos = _from_bytes(data, pos, n_style_ints)
+    records, pos = _from_bytes(data, pos, n_records)
+    text = data[pos:pos + n_blob].decode("utf8")
+
+    strings = []
+    start = 0
+    for length in lengths:
+        strings.append(text[start:start + length])
+        start += length
+
+    styles = [None]
+    i = 0
+    while i < len(style_ints):
+        count = style_ints[i]
+        styles.append(ComputedStyle.intern(
+            {strings[style_ints[j]]: strings[style_ints[j + 1]]
+             for j in range(i + 1, i + 1 + 2 * count, 2)}))
+        i += 1 + 2 * count
+
+    root = None
+    open_elements = []  # [element, children still to read]
+    i = 0
+    while i < len(records):
+        parent = open_elements[-1][0] if open_elements else None
+        if records[i] == TEXT:
+            node = Text(strings[records[i + 1]], parent)
+            style = styles[records[i + 2]]
+            n_children = 0
+            i += 3
+        else:
+            count = records[i + 2]
+            attributes = {strings[records[j]]: strings[records[j + 1]]
+                          for j in range(i + 3, i + 3 + 2 * count, 2)}
+            node = Element(strings[records[i + 1]], attributes, parent)
+            i += 3 + 2 * count
+            n_children = records[i]
+            style = styles[records[i + 1]]
+            i += 2
+        if style is not None:
+            node.style = style
+
+        if parent is None:
+            root = node
+        else:
+            parent.children.append(node)
+            open_elements[-1][1] -= 1
+        if n_children:
+            open_elements.append([node, n_children])
+        while open_elements and open_elements[-1][1] == 0:
+            open_elements.pop()
+    return root